@@ -4,11 +4,11 @@
 # IMPORT LIBRARIES
 # ==============================================================================
 import os
-import pandas as pd
+import hashlib
 import re
-from datetime import datetime
-import numpy as np
-import statsmodels.api as sm
+import tempfile
+import time
+from functools import lru_cache
 
 try:
     import google.generativeai as genai
@@ -18,6 +18,105 @@ except ImportError:
 # ==============================================================================
 # AI FUNCTION 2: CASE CONSULTATION
 # ==============================================================================
+_VERIFICATION_DOMAINS = {
+    "Medication / Drug-related": [
+        "ยา", "drug", "medication", "แพ้ยา", "adr", "ade", "dose", "โดส",
+        "ฉีด", "ให้ยา", "dispense", "prescribe", "hyoscine", "antibiotic"
+    ],
+    "Patient Identification": [
+        "ผิดคน", "ระบุตัวตน", "hn", "ชื่อสกุล", "patient identification",
+        "wrong patient", "สลับคน"
+    ],
+    "Diagnosis / Assessment / Treatment delay": [
+        "วินิจฉัย", "diagnosis", "missed", "delay", "ล่าช้า", "ประเมิน",
+        "assessment", "fast track", "triage", "under triage", "over triage"
+    ],
+    "Procedure / Surgery / Anesthesia": [
+        "ผ่าตัด", "หัตถการ", "procedure", "surgery", "anesthesia", "ระงับความรู้สึก",
+        "bleeding", "pneumothorax", "complication"
+    ],
+    "Laboratory / Radiology / Diagnostic test": [
+        "lab", "ห้องปฏิบัติการ", "ผลตรวจ", "critical", "xray", "ct", "mri",
+        "รังสี", "สิ่งส่งตรวจ", "specimen"
+    ],
+    "Infection Prevention and Control": [
+        "ติดเชื้อ", "infection", "cauti", "vap", "clabsi", "ssi", "ล้างมือ",
+        "isolation", "แพร่กระจายเชื้อ"
+    ],
+    "Communication / Handoff / Documentation": [
+        "สื่อสาร", "ส่งต่อข้อมูล", "handoff", "เวชระเบียน", "บันทึก",
+        "documentation", "ไม่รายงาน", "รายงานล่าช้า"
+    ],
+    "Equipment / Device / IT system": [
+        "เครื่องมือ", "อุปกรณ์", "device", "infusion pump", "ระบบล่ม",
+        "his", "lis", "software", "network", "คอมพิวเตอร์"
+    ],
+    "Environment / Facility / Security": [
+        "สิ่งแวดล้อม", "อาคาร", "น้ำ", "ไฟฟ้า", "ลิฟต์", "ห้องน้ำ",
+        "ความปลอดภัย", "ทรัพย์สิน", "ขโมย", "ทำร้าย", "อาละวาด"
+    ],
+    "Referral / Transfer / Continuity of Care": [
+        "ส่งต่อ", "refer", "transfer", "รถพยาบาล", "ambulance",
+        "continuity", "จำหน่าย", "กลับมา er", "readmission"
+    ],
+    "Complaint / Legal / Reputation": [
+        "ร้องเรียน", "ฟ้อง", "คดี", "สื่อ", "social", "ดราม่า", "เสียชื่อเสียง"
+    ],
+    "Privacy / Cybersecurity / Data": [
+        "ข้อมูลส่วนบุคคล", "privacy", "pdpa", "ข้อมูลรั่ว", "cyber",
+        "confidentiality", "integrity", "availability"
+    ],
+    "Blood Transfusion": [
+        "เลือด", "transfusion", "blood", "ส่วนประกอบของเลือด", "ให้เลือด"
+    ],
+    "Fall / Pressure injury / Patient harm": [
+        "ตกเตียง", "fall", "แผลกดทับ", "pressure injury", "บาดเจ็บ"
+    ]
+}
+
+_PROCESS_CHECKS = {
+    "มีการระบุว่าตรวจสอบแล้ว": [
+        "ตรวจสอบแล้ว", "reviewed", "confirmed", "verified"
+    ],
+    "ไม่มีประวัติเสี่ยงเดิม": [
+        "ไม่มีประวัติ", "ไม่พบประวัติ", "no history", "nka"
+    ],
+    "ทำถูกคน": [
+        "ถูกคน", "right patient", "ยืนยันตัวตน", "identify"
+    ],
+    "ทำถูกชนิด/ถูกคำสั่ง": [
+        "ถูกยา", "ถูกชนิด", "ถูกคำสั่ง", "right drug", "right procedure", "right test"
+    ],
+    "ทำถูกขนาด/ถูกวิธี/ถูกเวลา": [
+        "ถูกโดส", "ถูกขนาด", "ถูกวิธี", "ถูกเวลา", "right dose", "right route", "right time"
+    ],
+    "มีการเฝ้าระวังหรือติดตามหลังทำ": [
+        "observe", "เฝ้าระวัง", "ติดตามอาการ", "monitor", "follow up"
+    ],
+    "มีอาการหรือผลลัพธ์ไม่พึงประสงค์หลังเหตุการณ์": [
+        "หลัง", "กลับมา", "อาการ", "ผื่น", "คัน", "ปวด", "เสียชีวิต", "บาดเจ็บ",
+        "ทรุด", "complication", "adverse", "harm"
+    ],
+    "มีความล่าช้า": [
+        "delay", "ล่าช้า", "รอนาน", "ไม่ทัน", "เกินเวลา"
+    ],
+    "มีข้อมูลการสื่อสารหรือส่งต่อ": [
+        "แจ้ง", "รายงาน", "สื่อสาร", "ส่งต่อ", "handoff", "refer"
+    ]
+}
+
+# รวม keyword ของแต่ละกลุ่มเป็น regex เดียว (compile ครั้งเดียวตอน import)
+# เพื่อสแกนข้อความครั้งเดียวต่อกลุ่ม แทนการวนเช็ค substring ทีละคำ
+_DOMAIN_PATTERNS = [
+    (domain, re.compile("|".join(map(re.escape, keywords))))
+    for domain, keywords in _VERIFICATION_DOMAINS.items()
+]
+_PROCESS_CHECK_PATTERNS = [
+    (check, re.compile("|".join(map(re.escape, keywords))))
+    for check, keywords in _PROCESS_CHECKS.items()
+]
+
+@lru_cache(maxsize=256)
 def build_general_verification_context(incident_description: str) -> str:
     """
     สร้างบริบทตรวจสอบข้อมูลเบื้องต้นสำหรับอุบัติการณ์ทุกประเภท
@@ -26,101 +125,14 @@ def build_general_verification_context(incident_description: str) -> str:
     """
     text = incident_description.lower()
 
-    domains = {
-        "Medication / Drug-related": [
-            "ยา", "drug", "medication", "แพ้ยา", "adr", "ade", "dose", "โดส",
-            "ฉีด", "ให้ยา", "dispense", "prescribe", "hyoscine", "antibiotic"
-        ],
-        "Patient Identification": [
-            "ผิดคน", "ระบุตัวตน", "hn", "ชื่อสกุล", "patient identification",
-            "wrong patient", "สลับคน"
-        ],
-        "Diagnosis / Assessment / Treatment delay": [
-            "วินิจฉัย", "diagnosis", "missed", "delay", "ล่าช้า", "ประเมิน",
-            "assessment", "fast track", "triage", "under triage", "over triage"
-        ],
-        "Procedure / Surgery / Anesthesia": [
-            "ผ่าตัด", "หัตถการ", "procedure", "surgery", "anesthesia", "ระงับความรู้สึก",
-            "bleeding", "pneumothorax", "complication"
-        ],
-        "Laboratory / Radiology / Diagnostic test": [
-            "lab", "ห้องปฏิบัติการ", "ผลตรวจ", "critical", "xray", "ct", "mri",
-            "รังสี", "สิ่งส่งตรวจ", "specimen"
-        ],
-        "Infection Prevention and Control": [
-            "ติดเชื้อ", "infection", "cauti", "vap", "clabsi", "ssi", "ล้างมือ",
-            "isolation", "แพร่กระจายเชื้อ"
-        ],
-        "Communication / Handoff / Documentation": [
-            "สื่อสาร", "ส่งต่อข้อมูล", "handoff", "เวชระเบียน", "บันทึก",
-            "documentation", "ไม่รายงาน", "รายงานล่าช้า"
-        ],
-        "Equipment / Device / IT system": [
-            "เครื่องมือ", "อุปกรณ์", "device", "infusion pump", "ระบบล่ม",
-            "his", "lis", "software", "network", "คอมพิวเตอร์"
-        ],
-        "Environment / Facility / Security": [
-            "สิ่งแวดล้อม", "อาคาร", "น้ำ", "ไฟฟ้า", "ลิฟต์", "ห้องน้ำ",
-            "ความปลอดภัย", "ทรัพย์สิน", "ขโมย", "ทำร้าย", "อาละวาด"
-        ],
-        "Referral / Transfer / Continuity of Care": [
-            "ส่งต่อ", "refer", "transfer", "รถพยาบาล", "ambulance",
-            "continuity", "จำหน่าย", "กลับมา er", "readmission"
-        ],
-        "Complaint / Legal / Reputation": [
-            "ร้องเรียน", "ฟ้อง", "คดี", "สื่อ", "social", "ดราม่า", "เสียชื่อเสียง"
-        ],
-        "Privacy / Cybersecurity / Data": [
-            "ข้อมูลส่วนบุคคล", "privacy", "pdpa", "ข้อมูลรั่ว", "cyber",
-            "confidentiality", "integrity", "availability"
-        ],
-        "Blood Transfusion": [
-            "เลือด", "transfusion", "blood", "ส่วนประกอบของเลือด", "ให้เลือด"
-        ],
-        "Fall / Pressure injury / Patient harm": [
-            "ตกเตียง", "fall", "แผลกดทับ", "pressure injury", "บาดเจ็บ"
-        ]
-    }
-
-    process_checks = {
-        "มีการระบุว่าตรวจสอบแล้ว": [
-            "ตรวจสอบแล้ว", "reviewed", "confirmed", "verified"
-        ],
-        "ไม่มีประวัติเสี่ยงเดิม": [
-            "ไม่มีประวัติ", "ไม่พบประวัติ", "no history", "nka"
-        ],
-        "ทำถูกคน": [
-            "ถูกคน", "right patient", "ยืนยันตัวตน", "identify"
-        ],
-        "ทำถูกชนิด/ถูกคำสั่ง": [
-            "ถูกยา", "ถูกชนิด", "ถูกคำสั่ง", "right drug", "right procedure", "right test"
-        ],
-        "ทำถูกขนาด/ถูกวิธี/ถูกเวลา": [
-            "ถูกโดส", "ถูกขนาด", "ถูกวิธี", "ถูกเวลา", "right dose", "right route", "right time"
-        ],
-        "มีการเฝ้าระวังหรือติดตามหลังทำ": [
-            "observe", "เฝ้าระวัง", "ติดตามอาการ", "monitor", "follow up"
-        ],
-        "มีอาการหรือผลลัพธ์ไม่พึงประสงค์หลังเหตุการณ์": [
-            "หลัง", "กลับมา", "อาการ", "ผื่น", "คัน", "ปวด", "เสียชีวิต", "บาดเจ็บ",
-            "ทรุด", "complication", "adverse", "harm"
-        ],
-        "มีความล่าช้า": [
-            "delay", "ล่าช้า", "รอนาน", "ไม่ทัน", "เกินเวลา"
-        ],
-        "มีข้อมูลการสื่อสารหรือส่งต่อ": [
-            "แจ้ง", "รายงาน", "สื่อสาร", "ส่งต่อ", "handoff", "refer"
-        ]
-    }
-
     detected_domains = [
-        domain for domain, keywords in domains.items()
-        if any(keyword in text for keyword in keywords)
+        domain for domain, pattern in _DOMAIN_PATTERNS
+        if pattern.search(text)
     ]
 
     detected_checks = [
-        check for check, keywords in process_checks.items()
-        if any(keyword in text for keyword in keywords)
+        check for check, pattern in _PROCESS_CHECK_PATTERNS
+        if pattern.search(text)
     ]
 
     if not detected_domains:
@@ -145,6 +157,154 @@ def build_general_verification_context(incident_description: str) -> str:
     - ให้ใช้ภาษาว่า "อาจพิจารณา", "ข้อมูลเบื้องต้นสนับสนุน", "ยังไม่พบหลักฐานเพียงพอ" แทนการฟันธง
     """
 # ==============================================================================
+# HELPER FUNCTION: GEMINI RESPONSE CACHE
+# ==============================================================================
+# เก็บคำตอบของ Gemini ลงดิสก์ โดยใช้ sha256(model + prompt) เป็นชื่อไฟล์
+# เมื่อผู้ใช้ส่งอุบัติการณ์เดิมซ้ำ จะได้คำตอบทันทีโดยไม่ต้องเรียก API
+# - คำตอบเป็นข้อมูลอุบัติการณ์ทางคลินิก จึงสร้างโฟลเดอร์/ไฟล์ให้อ่านได้เฉพาะเจ้าของ (0700/0600)
+# - จำกัดจำนวนไฟล์ (LLM_CACHE_MAX_ENTRIES) และอายุ (LLM_CACHE_TTL วินาที) โดยลบไฟล์ที่ใช้ล่าสุดนานที่สุดก่อน
+# ปิดการใช้งานได้ด้วย LLM_CACHE=0
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE", "1") != "0"
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", "/tmp/llm_cache")
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "200"))
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+
+
+def _llm_cache_key(model_name: str, prompt: str) -> str:
+    """สร้าง key ของ cache จากชื่อ model และ prompt"""
+    digest = hashlib.sha256()
+    digest.update(model_name.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(prompt.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _llm_cache_get(key: str):
+    """คืนคำตอบที่เคย cache ไว้ หรือ None หากไม่พบ/หมดอายุ"""
+    if not LLM_CACHE_ENABLED:
+        return None
+    path = os.path.join(LLM_CACHE_DIR, f"{key}.txt")
+    try:
+        if time.time() - os.path.getmtime(path) > LLM_CACHE_TTL:
+            os.remove(path)
+            return None
+        with open(path, encoding="utf-8") as f:
+            value = f.read()
+        # อัปเดตเวลาใช้งานล่าสุด เพื่อให้การลบไฟล์เก่าเป็นแบบ LRU
+        os.utime(path)
+        return value or None
+    except OSError:
+        return None
+
+
+def _llm_cache_prune() -> None:
+    """ลบไฟล์ที่หมดอายุ และไฟล์ที่ใช้ล่าสุดนานที่สุดเมื่อจำนวนเกิน LLM_CACHE_MAX_ENTRIES"""
+    entries = []
+    now = time.time()
+    for entry in os.scandir(LLM_CACHE_DIR):
+        if not entry.name.endswith(".txt"):
+            continue
+        try:
+            mtime = entry.stat().st_mtime
+            if now - mtime > LLM_CACHE_TTL:
+                os.remove(entry.path)
+            else:
+                entries.append((mtime, entry.path))
+        except OSError:
+            continue
+
+    entries.sort()
+    for _, path in entries[:max(len(entries) - LLM_CACHE_MAX_ENTRIES, 0)]:
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+
+
+def _llm_cache_put(key: str, value: str) -> None:
+    """บันทึกคำตอบลง cache (เขียนไฟล์ชั่วคราวที่ไม่ซ้ำกันแล้ว rename เพื่อไม่ให้อ่านเจอไฟล์ไม่ครบ)"""
+    if not LLM_CACHE_ENABLED:
+        return
+    tmp_path = None
+    try:
+        os.makedirs(LLM_CACHE_DIR, mode=0o700, exist_ok=True)
+        os.chmod(LLM_CACHE_DIR, 0o700)
+        # mkstemp สร้างไฟล์ชื่อไม่ซ้ำด้วยสิทธิ์ 0600 ปลอดภัยแม้หลาย session (thread) เขียน key เดียวกันพร้อมกัน
+        fd, tmp_path = tempfile.mkstemp(dir=LLM_CACHE_DIR, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(value)
+        os.replace(tmp_path, os.path.join(LLM_CACHE_DIR, f"{key}.txt"))
+        tmp_path = None
+        _llm_cache_prune()
+    except OSError as e:
+        print(f"Failed to write LLM cache: {e}")
+    finally:
+        if tmp_path:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+# ==============================================================================
+# GEMINI SETTINGS (อ่านจาก Render Environment ครั้งเดียวตอน import)
+# ==============================================================================
+def _load_gemini_api_keys() -> list:
+    """รายการ API keys ตามลำดับ fallback (ตัดค่าว่างออก)"""
+    api_keys = [
+        os.getenv("GEMINI_API_KEY"),
+        os.getenv("GEMINI_API_KEY_FALLBACK_1"),
+        os.getenv("GEMINI_API_KEY_FALLBACK_2"),
+        os.getenv("GEMINI_API_KEY_FALLBACK_3"),
+    ]
+    return [key for key in api_keys if key and key.strip()]
+
+
+def _load_gemini_model_names() -> list:
+    """รายการ Gemini models ตามลำดับ fallback"""
+    model_names = [
+        os.getenv("GEMINI_MODEL_PRIMARY", "gemini-2.5-flash"),
+        os.getenv("GEMINI_MODEL_FALLBACK_1", "gemini-2.0-flash"),
+        os.getenv("GEMINI_MODEL_FALLBACK_2", "gemini-2.0-pro"),
+        os.getenv("GEMINI_MODEL_FALLBACK_3", "gemini-2.5-flash"),
+    ]
+
+    # ลบค่าว่าง + ลบ model ซ้ำ โดยยังรักษาลำดับเดิม
+    cleaned_models = []
+    for model_name in model_names:
+        if model_name and model_name.strip() and model_name not in cleaned_models:
+            cleaned_models.append(model_name.strip())
+    return cleaned_models
+
+
+GEMINI_API_KEYS = _load_gemini_api_keys()
+GEMINI_MODEL_NAMES = _load_gemini_model_names()
+
+
+@lru_cache(maxsize=4)
+def _get_generative_client(api_key: str):
+    """
+    สร้าง GenerativeServiceClient ของ API key นี้โดยเฉพาะ
+    ไม่ใช้ genai.configure เพราะเป็นค่า global ที่ session อื่น (เช่น app.py หน้า RCA) เปลี่ยนได้ตลอด
+    หมายเหตุ: ใช้ _ClientManager ซึ่งเป็น API ภายในของ google-generativeai (ล็อกเวอร์ชันไว้ใน requirements.txt)
+    """
+    from google.generativeai import client as genai_client
+
+    manager = genai_client._ClientManager()
+    manager.configure(api_key=api_key)
+    return manager.make_client("generative")
+
+
+@lru_cache(maxsize=16)
+def _get_model(model_name: str, api_key: str):
+    """
+    คืน GenerativeModel ที่สร้างไว้แล้วสำหรับคู่ model + API key
+    โดยผูก client ของ key นั้นไว้กับ model ตั้งแต่ตอนสร้าง จึงไม่ขึ้นกับ genai.configure
+    """
+    model = genai.GenerativeModel(model_name)
+    model._client = _get_generative_client(api_key)
+    return model
+
+# ==============================================================================
 # HELPER FUNCTION: GEMINI FALLBACK RESPONSE
 # ==============================================================================
 def get_gemini_fallback_response(prompt: str) -> str:
@@ -162,14 +322,7 @@ def get_gemini_fallback_response(prompt: str) -> str:
     # -----------------------------
     # 1) API key fallback list
     # -----------------------------
-    api_keys = [
-        os.getenv("GEMINI_API_KEY"),
-        os.getenv("GEMINI_API_KEY_FALLBACK_1"),
-        os.getenv("GEMINI_API_KEY_FALLBACK_2"),
-        os.getenv("GEMINI_API_KEY_FALLBACK_3"),
-    ]
-
-    api_keys = [key for key in api_keys if key and key.strip()]
+    api_keys = GEMINI_API_KEYS
 
     if not api_keys:
         return (
@@ -180,37 +333,37 @@ def get_gemini_fallback_response(prompt: str) -> str:
     # -----------------------------
     # 2) Model fallback list
     # -----------------------------
-    model_names = [
-        os.getenv("GEMINI_MODEL_PRIMARY", "gemini-2.5-flash"),
-        os.getenv("GEMINI_MODEL_FALLBACK_1", "gemini-2.0-flash"),
-        os.getenv("GEMINI_MODEL_FALLBACK_2", "gemini-2.0-pro"),
-        os.getenv("GEMINI_MODEL_FALLBACK_3", "gemini-2.5-flash"),
-    ]
-
-    # ลบค่าว่าง + ลบ model ซ้ำ โดยยังรักษาลำดับเดิม
-    cleaned_models = []
-    for model_name in model_names:
-        if model_name and model_name.strip() and model_name not in cleaned_models:
-            cleaned_models.append(model_name.strip())
+    cleaned_models = GEMINI_MODEL_NAMES
 
     if not cleaned_models:
         return "ไม่พบชื่อ Gemini model ที่สามารถใช้งานได้ กรุณาตั้งค่า GEMINI_MODEL_PRIMARY"
 
     # -----------------------------
-    # 3) Try each API key + each model
+    # 3) Response cache
+    # -----------------------------
+    cache_keys = {model_name: _llm_cache_key(model_name, prompt) for model_name in cleaned_models}
+
+    for model_name in cleaned_models:
+        cached_text = _llm_cache_get(cache_keys[model_name])
+        if cached_text:
+            return cached_text
+
+    # -----------------------------
+    # 4) Try each API key + each model
     # -----------------------------
     errors = []
 
     for key_index, api_key in enumerate(api_keys, start=1):
         try:
-            genai.configure(api_key=api_key)
+            _get_generative_client(api_key)
 
             for model_name in cleaned_models:
                 try:
-                    model = genai.GenerativeModel(model_name)
+                    model = _get_model(model_name, api_key)
                     response = model.generate_content(prompt)
 
                     if response and hasattr(response, "text") and response.text:
+                        _llm_cache_put(cache_keys[model_name], response.text)
                         return response.text
 
                     errors.append(
@@ -230,7 +383,7 @@ def get_gemini_fallback_response(prompt: str) -> str:
             continue
 
     # -----------------------------
-    # 4) If all fallback failed
+    # 5) If all fallback failed
     # -----------------------------
     recent_errors = "\n".join(f"- {e}" for e in errors[-10:])
 
@@ -239,17 +392,12 @@ def get_gemini_fallback_response(prompt: str) -> str:
         "รายการ error ล่าสุดที่ตรวจพบ:\n"
         f"{recent_errors}"
     )
-def get_consultation_response(incident_description: str) -> str:
-    """
-    สร้าง Prompt ที่มี Knowledge Base ในตัว และเรียก Gemini API
-    เพื่อทำหน้าที่เป็นที่ปรึกษาด้านการบริหารความเสี่ยงสำหรับอุบัติการณ์ที่เกิดขึ้น
-    """
-    if not genai:
-        return "ขออภัยครับ ไลบรารี google.generativeai ไม่ได้ถูกติดตั้ง"
-    verification_context = build_general_verification_context(incident_description)
-
-    # --- Master Prompt พร้อมฐานข้อมูลความรู้ในตัว (เวอร์ชันอัปเดต) ---
-    master_prompt = f"""
+# ==============================================================================
+# MASTER PROMPT TEMPLATE
+# ==============================================================================
+# ข้อความคงที่ของ Master Prompt (รวมฐานข้อมูลความรู้) สร้างครั้งเดียวตอน import
+# แล้วนำมาต่อกับบริบทของแต่ละเคสใน get_consultation_response
+MASTER_PROMPT_HEADER = """
     **บทบาท:**
     คุณคือ "ผู้ช่วย AI ด้านการจัดการความเสี่ยง" (AI Risk Management Assistant) มีหน้าที่ช่วยสรุปข้อมูลและให้ข้อเสนอแนะเบื้องต้น สำหรับการรายงานอุบัติการณ์ไปยังระบบ NRLS & HRMS
     
@@ -261,7 +409,9 @@ def get_consultation_response(incident_description: str) -> str:
     - ห้ามให้คำตอบที่เด็ดขาด ฟันธง หรือรับประกันความถูกต้อง 100%
     - ห้ามใช้ตำแหน่งที่สูงกว่าผู้ใช้งาน เช่น "ผู้จัดการ" หรือ "ผู้เชี่ยวชาญ"
     **บริบทตรวจสอบข้อมูลเบื้องต้นจากระบบ:**
-    {verification_context}
+    """
+
+MASTER_PROMPT_KNOWLEDGE = """
     หากมีข้อมูลว่ากระบวนการบางส่วนได้รับการตรวจสอบแล้วว่าเป็นไปตามแนวทาง 
     ให้ AI ต้องระบุส่วนที่ตรวจสอบแล้วอย่างชัดเจนก่อนตีความเหตุการณ์ 
     และห้ามเหมารวมว่าเป็นความผิดพลาดของกระบวนการทั้งหมด
@@ -1295,7 +1445,9 @@ def get_consultation_response(incident_description: str) -> str:
 
     **รายละเอียดอุบัติการณ์จากผู้ใช้:**
     '''
-    {incident_description}
+    """
+
+MASTER_PROMPT_TAIL = """
     '''
 
     **คำสั่ง:**
@@ -1352,4 +1504,22 @@ def get_consultation_response(incident_description: str) -> str:
     หากค้นหาแล้ว ไม่พบข้อมูล ใน "เป้าหมายที่เกี่ยวข้อง" เลย (array ว่าง) ให้แสดงข้อความว่า: "สำหรับอุบัติการณ์นี้ ไม่พบเป้าหมายความปลอดภัยที่เกี่ยวข้องโดยตรงในฐานข้อมูล 3P Safety ควรพิจารณาตามบริบทขององค์กรและมาตรฐานวิชาชีพที่เกี่ยวข้อง"
     """
 
+def get_consultation_response(incident_description: str) -> str:
+    """
+    สร้าง Prompt ที่มี Knowledge Base ในตัว และเรียก Gemini API
+    เพื่อทำหน้าที่เป็นที่ปรึกษาด้านการบริหารความเสี่ยงสำหรับอุบัติการณ์ที่เกิดขึ้น
+    """
+    if not genai:
+        return "ขออภัยครับ ไลบรารี google.generativeai ไม่ได้ถูกติดตั้ง"
+    verification_context = build_general_verification_context(incident_description)
+
+    # --- Master Prompt พร้อมฐานข้อมูลความรู้ในตัว (เวอร์ชันอัปเดต) ---
+    master_prompt = "".join((
+        MASTER_PROMPT_HEADER,
+        verification_context,
+        MASTER_PROMPT_KNOWLEDGE,
+        incident_description,
+        MASTER_PROMPT_TAIL,
+    ))
+
     return get_gemini_fallback_response(master_prompt)
@@ -5,6 +5,10 @@ from oauth2client.service_account import ServiceAccountCredentials
 from datetime import datetime
 import os  
 import json 
+import queue
+import threading
+import time
+from functools import lru_cache
 
 # --- การตั้งค่าการเชื่อมต่อ ---
 SCOPE = [
@@ -12,21 +16,39 @@ SCOPE = [
     "https://www.googleapis.com/auth/drive.file"
 ]
 
-# อ่านค่า JSON ทั้งหมดจาก Environment Variable ที่เราตั้งบน Render
+# อ่านค่า JSON ทั้งหมดจาก Environment Variable ที่เราตั้งบน Render (ถ้าไม่มีจะใช้ st.secrets แทน)
 GCP_CREDS_STR = os.environ.get("GCP_CREDS_JSON")
 SHEET_NAME = "HRMS-analyzed" # ชื่อ Google Sheet ที่คุณสร้าง
 
+# --- การตั้งค่าคิวบันทึกข้อมูล ---
+# log จะถูกใส่คิวไว้ก่อน แล้วมี thread เบื้องหลังส่งไป Google Sheets ทีละชุด
+# เพื่อไม่ให้การคลิกปุ่มต้องรอ API ของ Google ทุกครั้ง
+LOG_BATCH_SIZE = 50        # จำนวนแถวสูงสุดต่อการส่งหนึ่งครั้ง
+LOG_FLUSH_INTERVAL = 5     # รอรวมแถวได้นานสุดกี่วินาทีก่อนส่ง
+LOG_QUEUE_MAXSIZE = 1000   # ถ้าคิวเต็ม (เช่น Google API ล่ม) จะทิ้ง log ใหม่แทนการกินหน่วยความจำ
+
+def _load_gcp_creds_dict():
+    """อ่าน credentials ของ Service Account: ใช้ GCP_CREDS_JSON (Render) ก่อน ถ้าไม่มีจึงลอง st.secrets"""
+    # 1) ลองจาก ENV
+    if GCP_CREDS_STR:
+        # แปลงข้อความ (string) JSON ที่ยาวๆ ให้กลายเป็น dictionary ที่ Python ใช้ได้
+        return json.loads(GCP_CREDS_STR)
+    # 2) ลองอ่านจาก secrets ถ้ามีไฟล์
+    try:
+        return dict(st.secrets["gcp_service_account"])  # ถ้าไม่มีไฟล์/คีย์จะโยน exception
+    except Exception:
+        return None
+
 @st.cache_resource
 def get_gspread_client():
     """สร้างและคืน client สำหรับเชื่อมต่อ Google Sheets"""
-    # ตรวจสอบว่ามีตัวแปรนี้อยู่จริงหรือไม่
-    if not GCP_CREDS_STR:
-        # ไม่แสดง error บนหน้าเว็บจริง แต่จะ print ไว้ใน log ของ Render
-        print("CRITICAL ERROR: ไม่พบค่า GCP_CREDS_JSON ใน Environment Variables!")
-        return None
     try:
-        # แปลงข้อความ (string) JSON ที่ยาวๆ ให้กลายเป็น dictionary ที่ Python ใช้ได้
-        creds_dict = json.loads(GCP_CREDS_STR)
+        creds_dict = _load_gcp_creds_dict()
+        # ตรวจสอบว่ามี credentials อยู่จริงหรือไม่
+        if not creds_dict:
+            # ไม่แสดง error บนหน้าเว็บจริง แต่จะ print ไว้ใน log ของ Render
+            print("CRITICAL ERROR: ไม่พบค่า GCP_CREDS_JSON ใน Environment Variables หรือ gcp_service_account ใน secrets!")
+            return None
         creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, SCOPE)
         client = gspread.authorize(creds)
         return client
@@ -34,17 +56,56 @@ def get_gspread_client():
         print(f"GSpread Connection Error: {e}")
         return None        
 
-def log_to_sheet(sheet_name, data_row: list):
-    """ฟังก์ชันกลางสำหรับบันทึกข้อมูลลงชีต"""
+@lru_cache(maxsize=None)
+def _get_worksheet(client, sheet_name):
+    """เปิด worksheet ครั้งเดียวแล้วเก็บไว้ใช้ซ้ำ"""
+    return client.open(SHEET_NAME).worksheet(sheet_name)
+
+def _flush_rows(batch):
+    """ส่งแถวที่อยู่ในคิวไปยังชีต โดยรวมเป็นการเรียก append_rows ครั้งเดียวต่อชีต"""
     client = get_gspread_client()
-    if client:
+    if not client:
+        return
+    rows_by_sheet = {}
+    for sheet_name, data_row in batch:
+        rows_by_sheet.setdefault(sheet_name, []).append(data_row)
+    for sheet_name, rows in rows_by_sheet.items():
         try:
-            sheet = client.open(SHEET_NAME).worksheet(sheet_name)
-            sheet.append_row(data_row)
+            sheet = _get_worksheet(client, sheet_name)
+            sheet.append_rows(rows, value_input_option="RAW")
         except Exception as e:
             # ใน Production จริง อาจจะแค่ print log แทนการแสดง error
             print(f"Failed to log to sheet '{sheet_name}': {e}")
 
+def _log_flusher():
+    """thread เบื้องหลัง: รอ log จากคิว แล้วส่งเป็นชุดทุก LOG_FLUSH_INTERVAL วินาที หรือเมื่อครบ LOG_BATCH_SIZE แถว"""
+    while True:
+        batch = [_LOG_QUEUE.get()]
+        deadline = time.monotonic() + LOG_FLUSH_INTERVAL
+        while len(batch) < LOG_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(_LOG_QUEUE.get(timeout=remaining))
+            except queue.Empty:
+                break
+        try:
+            _flush_rows(batch)
+        except Exception as e:
+            # ทิ้ง batch ที่มีปัญหา แต่ให้ thread ทำงานต่อ ไม่เช่นนั้น log หลังจากนี้จะหายทั้งหมด
+            print(f"Failed to flush log batch ({len(batch)} rows): {e}")
+
+_LOG_QUEUE = queue.Queue(maxsize=LOG_QUEUE_MAXSIZE)
+threading.Thread(target=_log_flusher, name="sheets-log-flusher", daemon=True).start()
+
+def log_to_sheet(sheet_name, data_row: list):
+    """ฟังก์ชันกลางสำหรับบันทึกข้อมูลลงชีต (ใส่คิวไว้ ไม่รอการเชื่อมต่อ Google Sheets)"""
+    try:
+        _LOG_QUEUE.put_nowait((sheet_name, data_row))
+    except queue.Full:
+        print(f"Log queue is full, dropping row for sheet '{sheet_name}'")
+
 # --- ฟังก์ชันหลักสำหรับเรียกใช้ ---
 def log_visit():
     """บันทึกการเข้าชมแอป (จะทำงานแค่ครั้งแรกของ Session)"""